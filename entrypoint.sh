@@ -1,23 +1,11 @@
 #!/bin/bash
 
-# Default schedule interval is 5 minutes (300 seconds)
+# Default base schedule interval is 5 minutes (300 seconds)
 SCHEDULE_INTERVAL=${SCHEDULE_INTERVAL:-300}
+# Hard limit for a single sync cycle, in case it hangs despite the request timeouts
+SYNC_TIMEOUT=${SYNC_TIMEOUT:-900}
 
-echo "Starting Traefik to Pangolin Sync with schedule interval: ${SCHEDULE_INTERVAL} seconds"
+echo "Starting Traefik to Pangolin Sync with base schedule interval: ${SCHEDULE_INTERVAL} seconds"
 
-# Function to run the sync
-run_sync() {
-    echo "$(date): Starting sync..."
-    python3 main.py
-    echo "$(date): Sync completed"
-}
-
-# Run initial sync
-run_sync
-
-# Schedule subsequent runs
-while true; do
-    echo "$(date): Sleeping for ${SCHEDULE_INTERVAL} seconds..."
-    sleep ${SCHEDULE_INTERVAL}
-    run_sync
-done
\ No newline at end of file
+# Each site is synced on its own adaptive interval, see README.md
+exec python3 main.py --schedule --interval "${SCHEDULE_INTERVAL}" --cycle-timeout "${SYNC_TIMEOUT}"
@@ -0,0 +1,24 @@
+"""JSON encoding and decoding, using orjson when it is installed and the stdlib json module otherwise"""
+from typing import Any, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+    import json
+
+BACKEND = 'orjson' if orjson else 'json'
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    """Parse a JSON document, raises ValueError when it is invalid"""
+    if orjson:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj: Any) -> bytes:
+    """Serialize to compact UTF-8 encoded JSON"""
+    if orjson:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':')).encode()
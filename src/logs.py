@@ -0,0 +1,53 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+from typing import Optional
+import json_codec
+
+TEXT_FORMAT = '%(asctime)s %(levelname)-7s %(message)s'
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line, with the record's extra 'fields' merged in (tracebacks are
+    already part of the message, QueueHandler formats them before queueing)"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+                 'level': record.levelname,
+                 'logger': record.name,
+                 'message': record.getMessage()}
+        entry.update(getattr(record, 'fields', {}))
+        return json_codec.dumps(entry).decode()
+
+
+def setup_logging(level: str = 'INFO', log_format: str = 'text') -> None:
+    """Log through a queue so callers never block on stdout, a background thread does the writing"""
+    global _listener
+    if _listener:
+        _listener.stop()
+
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JSONFormatter() if log_format == 'json' else logging.Formatter(TEXT_FORMAT))
+
+    root = logging.getLogger()
+    root.handlers = [logging.handlers.QueueHandler(queue.SimpleQueue())]
+    root.setLevel(level.upper())
+    # One line per HTTP request at DEBUG level is too much even for debugging
+    logging.getLogger('urllib3').setLevel(logging.WARNING)
+
+    _listener = logging.handlers.QueueListener(root.handlers[0].queue, handler)
+    _listener.start()
+
+
+def _stop_listener() -> None:
+    """Flush queued records on exit"""
+    if _listener:
+        _listener.stop()
+
+
+atexit.register(_stop_listener)
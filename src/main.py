@@ -1,57 +1,233 @@
 #!/usr/bin/env python3
+import argparse
+import logging
+import os
+import signal
+import time
+from typing import Optional
 from settings import Settings
+from logs import setup_logging
 from pangolin_client import Pangolin
 from traefik_client import Traefik
+from scheduler import Scheduler, STATIC_FORWARDS
+from state import SyncState
+from status import StatusAPI, SyncStatus
 from sync import Sync
 
+log = logging.getLogger(__name__)
 
-def main():
-    settings = Settings()
+
+class CycleTimeout(Exception):
+    pass
+
+
+def run_cycle(settings: Settings, state: SyncState, due: Optional[set] = None,
+              status: Optional[SyncStatus] = None) -> dict:
+    """Run one sync cycle of the static forwards and the due Traefik sites (all when None), the
+    others only contribute their last good discovery to cleanup. Returns whether each site that ran changed,
+    None for sites that could not be discovered."""
+    status = status or SyncStatus()
+    results = {}
+    started = time.monotonic()
+    deadline = started + settings.cycle_deadline
     pangolin = Pangolin(settings)
-    sync = Sync(settings, pangolin)
+    sync = Sync(settings, pangolin, deadline=deadline, state=state, status=status)
 
-    print(">>> Building Pangolin resource cache...")
-    pangolin.build_caches()
+    log.info(">>> Building Pangolin resource cache...")
+    if not pangolin.build_caches():
+        # Without the resource list every existing resource would look new and be created again
+        log.error("Failed loading Pangolin caches, skipping this sync")
+        return {name: None for name in due} if due is not None else {}
+    state.clear_resolved_forward_failures(set(pangolin.domain_id_cache), set(pangolin.site_id_cache))
 
-    print(">>> Syncing static forwards...")
+    # Static forwards are synced in every cycle, they only cost the Pangolin calls of the cycle
+    log.info(">>> Syncing static forwards...")
     sync.sync_static_forwards(static_http_forwards=settings.static_http_forwards,
                              static_tcp_forwards=settings.static_tcp_forwards,
                              static_udp_forwards=settings.static_udp_forwards)
+    results[STATIC_FORWARDS] = False
 
-    all_valid_domains = set()
-    all_valid_tcp_ports = set()
-    all_valid_udp_ports = set()
-
-    static_domains, static_tcp_ports, static_udp_ports = sync.get_valid_resources(
-        settings.static_http_forwards, settings.static_tcp_forwards, settings.static_udp_forwards
-    )
-    all_valid_domains.update(static_domains)
-    all_valid_tcp_ports.update(static_tcp_ports)
-    all_valid_udp_ports.update(static_udp_ports)
+    # Resource keys per owner (Traefik instance name or static forwards), None for instances
+    # whose discovery is unavailable
+    valid_keys_by_owner = {
+        STATIC_FORWARDS: sync.get_valid_resource_keys(
+            settings.static_http_forwards, settings.static_tcp_forwards, settings.static_udp_forwards
+        )
+    }
+    status.record_discovery(STATIC_FORWARDS, valid_keys_by_owner[STATIC_FORWARDS], [], "configured")
 
+    traefiks = []
     for traefik_site in settings.traefik_sites:
         if not pangolin.get_site_id_for_site_name(traefik_site.site_name):
+           valid_keys_by_owner[traefik_site.name] = None
+           status.record_discovery(traefik_site.name, None, None, "unknown Pangolin site")
            continue
 
-        print(f">>> Processing Traefik site: {traefik_site.site_name}")
         traefik = Traefik(settings, traefik_site)
-        sync = Sync(settings, pangolin, traefik)
-        sync.sync_traefik_hosts()
+        traefik.entrypoint_ports = state.get_entrypoint_ports(traefik_site.name)
+        sync = Sync(settings, pangolin, traefik, deadline=deadline)
+        is_due = due is None or traefik_site.name in due
 
-        traefik_domains, traefik_tcp_ports, traefik_udp_ports = sync.get_valid_resources(
-            [], [], []
-        )
-        all_valid_domains.update(traefik_domains)
-        all_valid_tcp_ports.update(traefik_tcp_ports)
-        all_valid_udp_ports.update(traefik_udp_ports)
+        if is_due:
+            log.info(">>> Processing Traefik site: %s", traefik_site.name)
+            if state.is_circuit_open(traefik_site.name):
+                log.warning("Circuit breaker open for site %s, skipping Traefik discovery", traefik_site.name)
+            elif sync.deadline_exceeded():
+                log.warning("Cycle deadline exceeded, skipping Traefik discovery for site %s", traefik_site.name)
+            else:
+                traefik.get_hosts()
+                if traefik.fetch_failed:
+                    results[traefik_site.name] = None
+                    if state.record_site_failure(traefik_site.name,
+                                                 settings.circuit_breaker_threshold,
+                                                 settings.circuit_breaker_cooldown):
+                        log.warning("Opening circuit breaker for site %s for %s seconds",
+                                    traefik_site.name, settings.circuit_breaker_cooldown)
+                else:
+                    results[traefik_site.name] = state.record_site_success(
+                        traefik_site.name, traefik.get_hosts(), traefik.get_tcp_forwards(), traefik.get_udp_forwards(),
+                        traefik.entrypoint_ports)
+
+        if not traefik.fetched or traefik.fetch_failed:
+            # Sites that are not due or unreachable use their last good discovery for cleanup
+            # and for the targets of hosts they share with other sites
+            last_good_discovery = state.get_last_good_discovery(traefik_site.name)
+            if last_good_discovery is None:
+                log.warning("No previous host list for site %s, skipping its orphan cleanup", traefik_site.name)
+                valid_keys_by_owner[traefik_site.name] = None
+                status.record_discovery(traefik_site.name, None, None, "unavailable")
+                continue
+            if is_due:
+                log.info("Using %s hosts from the last successful discovery of site %s",
+                         len(last_good_discovery[0]), traefik_site.name)
+            traefik.use_stale_discovery(*last_good_discovery)
 
-    if settings.cleanup_orphaned_resources:
-        print(">>> Cleaning up orphaned resources...")
-        pangolin.cleanup_orphaned_resources(all_valid_domains, all_valid_tcp_ports, all_valid_udp_ports)
+        traefiks.append(traefik)
+
+        # Owners are Traefik instances, so instances sharing a Pangolin site keep each other's resources
+        valid_keys_by_owner[traefik_site.name] = sync.get_valid_resource_keys([], [], [])
+        if not traefik.stale:
+            status.record_discovery(traefik_site.name, valid_keys_by_owner[traefik_site.name],
+                                    traefik.rejected_hosts, "discovered")
+        elif is_due:
+            status.record_discovery(traefik_site.name, valid_keys_by_owner[traefik_site.name],
+                                    None, "using last discovery")
+
+    if any(not traefik.stale for traefik in traefiks):
+        Sync(settings, pangolin, deadline=deadline, state=state, status=status).sync_traefik_sites(traefiks)
+
+    state.adopt_resources(pangolin.get_resources_by_key(), valid_keys_by_owner)
+    status.record_cycle(pangolin.get_resources_by_key(), state.forward_failures)
+
+    if not settings.cleanup_orphaned_resources:
+        log.info(">>> Skipping cleanup of orphaned resources (disabled in settings)")
     else:
-        print(">>> Skipping cleanup of orphaned resources (disabled in settings)")
+        log.info(">>> Cleaning up orphaned resources...")
+        pangolin.cleanup_orphaned_resources(state, valid_keys_by_owner)
+
+    state.save()
+
+    _log_cycle_summary(pangolin, state, status, due, time.monotonic() - started)
+    return results
+
+
+def _log_cycle_summary(pangolin: Pangolin, state: SyncState, status: SyncStatus, due: Optional[set], duration: float) -> None:
+    """One record per cycle counting what was changed, unchanged forwards are only logged at DEBUG level"""
+    stats = {key: pangolin.stats[key] for key in ('created', 'updated', 'unchanged', 'failed', 'backing_off', 'deleted')}
+    fields = {'event': 'cycle_summary',
+              'duration': round(duration, 3),
+              'sites': sorted(due) if due is not None else None,
+              'forwards': len(status.forwards),
+              'pending_failures': len(state.forward_failures),
+              **stats}
+    counts = ", ".join(f"{count} {key.replace('_', ' ')}" for key, count in stats.items())
+    log.info(">>> All syncs completed in %.1fs: %s", duration, counts, extra={'fields': fields})
+
+
+def _raise_cycle_timeout(signum, frame):
+    raise CycleTimeout()
+
+
+def run_scheduled(base_interval: int, cycle_timeout: int) -> None:
+    """Sync forever, each site on its own adaptive interval"""
+    scheduler = Scheduler(base_interval)
+    state = None
+    status = SyncStatus()
+    signal.signal(signal.SIGALRM, _raise_cycle_timeout)
+
+    settings = Settings()
+    if settings.status_api_port:
+        # The status API is optional, syncing goes on without it
+        try:
+            StatusAPI(status, settings.status_api_address, settings.status_api_port).start()
+        except OSError as e:
+            log.error("Unable to serve status API on %s:%s, continuing without it: %s",
+                      settings.status_api_address, settings.status_api_port, e)
+
+    while True:
+        try:
+            settings = Settings()
+            if state is None:
+                state = SyncState(settings.state_file)
+            scheduler.update_sites(settings)
+
+            due = set(scheduler.due(time.monotonic()))
+            if due:
+                log.info("Starting sync of %s...", ', '.join(sorted(due)))
+                with state.lock() as locked:
+                    if not locked:
+                        log.warning("Another sync is running, skipping this cycle")
+                        results = {}
+                    else:
+                        signal.alarm(cycle_timeout)
+                        try:
+                            results = run_cycle(settings, state, due, status)
+                        finally:
+                            signal.alarm(0)
+
+                now = time.monotonic()
+                for name in due:
+                    scheduler.record_run(name, results.get(name), now)
+                log.info("Next runs: %s",
+                         ", ".join(str(schedule) for schedule in scheduler.schedules.values() if schedule.name in due))
+        except CycleTimeout:
+            log.error("Sync cycle killed after %s seconds", cycle_timeout)
+            now = time.monotonic()
+            for name in due:
+                scheduler.record_run(name, None, now)
+        except Exception:
+            log.exception("Sync cycle failed")
+            time.sleep(base_interval)
+            continue
+
+        sleep_for = scheduler.seconds_until_next_run(time.monotonic())
+        if sleep_for > 0:
+            time.sleep(sleep_for)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync Traefik routes to Pangolin")
+    parser.add_argument('--schedule', action='store_true',
+                        help="keep running and sync each site on its own adaptive interval")
+    parser.add_argument('--interval', type=int, default=int(os.environ.get('SCHEDULE_INTERVAL', 300)),
+                        help="base sync interval in seconds (default: $SCHEDULE_INTERVAL or 300)")
+    parser.add_argument('--cycle-timeout', type=int, default=int(os.environ.get('SYNC_TIMEOUT', 900)),
+                        help="kill a sync cycle after this many seconds (default: $SYNC_TIMEOUT or 900)")
+    args = parser.parse_args()
+
+    settings = Settings()
+    setup_logging(settings.log_level, settings.log_format)
+
+    if args.schedule:
+        run_scheduled(args.interval, args.cycle_timeout)
+        return
 
-    print(">>> All syncs completed")
+    state = SyncState(settings.state_file)
+    with state.lock() as locked:
+        if not locked:
+            log.warning("Another sync is running, skipping this run")
+            return
+        run_cycle(settings, state)
 
 if __name__ == '__main__':
     main()
@@ -1,5 +1,5 @@
 from enum import Enum
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Optional
 
 
@@ -8,6 +8,11 @@ class HTTPForwardMethod(Enum):
     HTTPS = "HTTPS"
 
 
+class TraefikDiscoveryMode(Enum):
+    ROUTERS = "ROUTERS"
+    RAWDATA = "RAWDATA"
+
+
 @dataclass
 class TCPForward:
     site_name: str
@@ -43,9 +48,24 @@ class TraefikSite:
     target_port: int
     target_method: HTTPForwardMethod
     host_whitelist: list[str]
+    connect_timeout: float = 5
+    read_timeout: float = 10
+    discovery_mode: TraefikDiscoveryMode = TraefikDiscoveryMode.ROUTERS
+    api_rawdata_path: str = "/rawdata"
+    api_entrypoints_path: str = "/entrypoints"
+    entrypoint_ports: dict[str, int] = field(default_factory=dict)
+    entrypoint_whitelist: list[str] = field(default_factory=list)
+    sync_interval: Optional[int] = None
+    min_sync_interval: Optional[int] = None
+    max_sync_interval: Optional[int] = None
+    # Identifies this Traefik instance in the sync state, defaults to site_name
+    name: Optional[str] = None
+
+    def __post_init__(self) -> None:
+        self.name = self.name or self.site_name
 
     def __str__(self) -> str:
-        return f"TraefikSite({self.site_name}: {self.api_url})"
+        return f"TraefikSite({self.name}: {self.api_url})"
 
 
 @dataclass
@@ -65,3 +85,11 @@ class HTTPForward:
 
     def __str__(self) -> str:
         return f"{self.fqdn}→ {self.target_method.value.lower()}://{self.target_host}:{self.target_port} ({self.site_name})"
+
+
+@dataclass
+class ForwardFailure:
+    """A failure that will repeat until something changes, dependency names the
+    missing cache entry (e.g. "domain:example.com" or "site:my-site") if any"""
+    reason: str
+    dependency: Optional[str] = None
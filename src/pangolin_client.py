@@ -1,7 +1,14 @@
+import logging
 import requests
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Optional
-from models import HTTPForward, TCPForward, UDPForward
+import json_codec
+from models import HTTPForward, TCPForward, UDPForward, ForwardFailure
 from settings import Settings
+from state import SyncState
+
+log = logging.getLogger(__name__)
 
 
 class Pangolin:
@@ -10,80 +17,121 @@ class Pangolin:
         self.domain_id_cache = {}
         self.site_id_cache = {}
         self.site_nice_id_cache = {}
+        # Set when a request fails in a way that retrying won't fix, reset by the caller
+        self.last_failure: Optional[ForwardFailure] = None
+        # What this run changed (or found up to date), for the cycle summary
+        self.stats = Counter()
         self.s = s
         self.headers = {
             'accept': '*/*',
             'Authorization': f'Bearer {s.pangolin_api_key}',
             'Content-Type': 'application/json'
         }
+        # One session per run keeps connections alive across its requests, sized for the cleanup threads
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=max(10, s.cleanup_concurrency))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.timeout = (s.pangolin_connect_timeout, s.pangolin_read_timeout)
+
+    def _request(self, method: str, url: str, json: Optional[dict] = None) -> Optional[requests.Response]:
+        data = json_codec.dumps(json) if json is not None else None
+        try:
+            return self.session.request(method, url, timeout=self.timeout, data=data)
+        except requests.exceptions.Timeout:
+            log.error("API Error: %s %s timed out", method, url)
+        except requests.exceptions.RequestException as e:
+            log.error("API Error: %s %s failed: %s", method, url, e)
+        return None
 
-    def _build_resource_cache(self) -> None:
+    def _build_resource_cache(self) -> bool:
         url = f"{self.s.pangolin_api_url}/org/{self.s.pangolin_org_id}/resources"
 
         if not self.resource_cache:
-            r = requests.get(url, headers=self.headers)
-            if not self._check_response_success(r):
-                return None
+            data = self._check_response_success(self._request('GET', url))
+            if not data:
+                return False
 
-            data = r.json()
             self.resource_cache = data.get('data', {}).get('resources', [])
-            print(f"Loaded {len(self.resource_cache)} resources into cache")
+            log.info("Loaded %s resources into cache", len(self.resource_cache))
 
-    def _build_domain_id_cache(self) -> None:
+        return True
+
+    def _build_domain_id_cache(self) -> bool:
         url = f"{self.s.pangolin_api_url}/org/{self.s.pangolin_org_id}/domains"
 
         if not self.domain_id_cache:
-            r = requests.get(url, headers=self.headers)
-            if not self._check_response_success(r):
-                return None
+            data = self._check_response_success(self._request('GET', url))
+            if not data:
+                return False
 
-            data = r.json()
             self.domain_id_cache = {domain['baseDomain']: domain['domainId'] for domain in data.get('data', {}).get('domains', {})}
-            print(f"Loaded {len(self.domain_id_cache)} domain<>domainID mappings into cache")
+            log.info("Loaded %s domain<>domainID mappings into cache", len(self.domain_id_cache))
             if self.domain_id_cache:
-                print("  [Domain]→ [Domain ID]")
+                log.debug("  [Domain]→ [Domain ID]")
                 for domain, domain_id in self.domain_id_cache.items():
-                    print(f"  {domain}→ {domain_id}")
+                    log.debug("  %s→ %s", domain, domain_id)
 
-    def _build_site_id_cache(self) -> None:
+        return True
+
+    def _build_site_id_cache(self) -> bool:
         url = f"{self.s.pangolin_api_url}/org/{self.s.pangolin_org_id}/sites"
 
         if not self.site_id_cache:
-            r = requests.get(url, headers=self.headers)
-            if not self._check_response_success(r):
-                return None
+            data = self._check_response_success(self._request('GET', url))
+            if not data:
+                return False
 
-            data = r.json()
             sites = data.get('data', {}).get('sites', {})
             self.site_id_cache = {site['name']: site['siteId'] for site in sites}
             self.site_nice_id_cache = {site['niceId']: site['name'] for site in sites}
-            print(f"Loaded {len(self.site_id_cache)} siteName<>siteID mappings into cache")
+            log.info("Loaded %s siteName<>siteID mappings into cache", len(self.site_id_cache))
             if self.site_id_cache:
-                print("  [Site Name]→ [Site ID]")
+                log.debug("  [Site Name]→ [Site ID]")
                 for site_name, site_id in self.site_id_cache.items():
-                    print(f"  {site_name}→ {site_id}")
+                    log.debug("  %s→ %s", site_name, site_id)
+
+        return True
+
+    def _check_response_success(self, r: Optional[requests.Response]) -> Optional[dict]:
+        """Parse the response body once, returns it when the request succeeded"""
+        if r is None:
+            return None
+
+        try:
+            data = json_codec.loads(r.content)
+        except ValueError:
+            data = None
 
-    def _check_response_success(self, r: requests.Response) -> Optional[requests.Response]:
         if r.status_code not in (200, 201):
-            try:
-                fail_message = r.json().get('message', 'Unknown Error')
-                print(f"API Error: {r.status_code} - {fail_message}")
-                return None
-            except Exception as e:
-                print(f"Generic HTTP Error: Request failure: {r.status_code}")
-                return None
-
-        data = r.json()
+            fail_message = data.get('message', 'Unknown Error') if isinstance(data, dict) else None
+            if fail_message is None:
+                log.error("Generic HTTP Error: Request failure: %s", r.status_code)
+            else:
+                log.error("API Error: %s - %s", r.status_code, fail_message)
+
+            # Client errors are structural, server errors and rate limiting are worth retrying
+            if 400 <= r.status_code < 500 and r.status_code != 429:
+                self.last_failure = ForwardFailure(reason=f"API rejected request: {r.status_code} - {fail_message or 'Unknown Error'}")
+            return None
+
+        if not isinstance(data, dict):
+            log.error("API Error: Unable to parse response from %s %s", r.request.method, r.url)
+            return None
+
         if not data.get('success', False):
-            print(f"API Error: {data.get('message', 'Unknown error')}")
+            log.error("API Error: %s", data.get('message', 'Unknown error'))
+            self.last_failure = ForwardFailure(reason=f"API rejected request: {data.get('message', 'Unknown error')}")
             return None
 
-        return r
+        return data
 
     def get_site_id_for_site_name(self, site_name: str) -> Optional[int]:
         site_id = self.site_id_cache.get(site_name)
         if not site_id:
-            print(f"Error: Unable to find siteId for site name {site_name} in cache")
+            log.error("Unable to find siteId for site name %s in cache", site_name)
+            self.last_failure = ForwardFailure(reason=f"Unknown site {site_name}", dependency=f"site:{site_name}")
         return site_id
 
     def check_domain_in_resource_cache(self, domain: str) -> bool:
@@ -108,10 +156,36 @@ class Pangolin:
                 return True
         return False
 
-    def build_caches(self) -> None:
-        self._build_resource_cache()
-        self._build_domain_id_cache()
-        self._build_site_id_cache()
+    def get_resource_key(self, resource: dict) -> Optional[str]:
+        """Identify a resource by what it exposes: http:<fqdn>, tcp:<port> or udp:<port>"""
+        if resource.get('http', False):
+            full_domain = resource.get('fullDomain')
+            return f"http:{full_domain.lower()}" if full_domain else None
+
+        if resource.get('protocol') in ['tcp', 'udp'] and resource.get('proxyPort'):
+            return f"{resource.get('protocol')}:{resource.get('proxyPort')}"
+
+        return None
+
+    def get_resources_by_key(self) -> dict:
+        return {self.get_resource_key(resource): resource for resource in self.resource_cache}
+
+    def _cache_created_resource(self, resource_id: int, site_name: str, payload: dict, **fields) -> None:
+        """Add a resource created during this run to the resource cache"""
+        site_nice_id = next((nice_id for nice_id, name in self.site_nice_id_cache.items() if name == site_name), None)
+        self.resource_cache.append({'resourceId': resource_id,
+                                    'name': payload['name'],
+                                    'siteId': site_nice_id,
+                                    'http': payload['http'],
+                                    'protocol': payload['protocol'],
+                                    **fields})
+
+    def build_caches(self) -> bool:
+        """Load all caches, returns False if any of them could not be fetched"""
+        resources_ok = self._build_resource_cache()
+        domains_ok = self._build_domain_id_cache()
+        sites_ok = self._build_site_id_cache()
+        return resources_ok and domains_ok and sites_ok
 
     def create_pangolin_tcp_resource(self, tcp_forward: TCPForward) -> Optional[int]:
         site_id = self.get_site_id_for_site_name(tcp_forward.site_name)
@@ -127,12 +201,15 @@ class Pangolin:
         }
 
         url = f"{self.s.pangolin_api_url}/org/{self.s.pangolin_org_id}/site/{site_id}/resource"
-        response = requests.put(url, headers=self.headers, json=payload)
-        if not self._check_response_success(response):
+        data = self._check_response_success(self._request('PUT', url, json=payload))
+        if not data:
             return None
 
-        data = response.json()
-        return data.get('data', {}).get('resourceId')
+        resource_id = data.get('data', {}).get('resourceId')
+        if resource_id:
+            self.stats['created'] += 1
+            self._cache_created_resource(resource_id, tcp_forward.site_name, payload, proxyPort=tcp_forward.source_port)
+        return resource_id
 
 
     def create_pangolin_udp_resource(self, udp_forward: UDPForward) -> Optional[int]:
@@ -149,17 +226,22 @@ class Pangolin:
         }
 
         url = f"{self.s.pangolin_api_url}/org/{self.s.pangolin_org_id}/site/{site_id}/resource"
-        response = requests.put(url, headers=self.headers, json=payload)
-        if not self._check_response_success(response):
+        data = self._check_response_success(self._request('PUT', url, json=payload))
+        if not data:
             return None
 
-        data = response.json()
-        return data.get('data', {}).get('resourceId')
+        resource_id = data.get('data', {}).get('resourceId')
+        if resource_id:
+            self.stats['created'] += 1
+            self._cache_created_resource(resource_id, udp_forward.site_name, payload, proxyPort=udp_forward.source_port)
+        return resource_id
 
     def create_pangolin_http_resource(self, forward: HTTPForward) -> Optional[int]:
         domain_id = self.domain_id_cache.get(forward.domain)
         if not domain_id:
-            print(f"Error: No domain ID mapping found for {forward.domain}. Have you configured Traefik to allow resources for this domain?")
+            log.error("No domain ID mapping found for %s. Have you configured Traefik to allow resources for this domain?",
+                      forward.domain)
+            self.last_failure = ForwardFailure(reason=f"Unknown domain {forward.domain}", dependency=f"domain:{forward.domain}")
             return
 
         site_id = self.get_site_id_for_site_name(forward.site_name)
@@ -176,12 +258,15 @@ class Pangolin:
         }
 
         url = f"{self.s.pangolin_api_url}/org/{self.s.pangolin_org_id}/site/{site_id}/resource"
-        response = requests.put(url, headers=self.headers, json=payload)
-        if not self._check_response_success(response):
+        data = self._check_response_success(self._request('PUT', url, json=payload))
+        if not data:
             return None
 
-        data = response.json()
-        return data.get('data', {}).get('resourceId')
+        resource_id = data.get('data', {}).get('resourceId')
+        if resource_id:
+            self.stats['created'] += 1
+            self._cache_created_resource(resource_id, forward.site_name, payload, fullDomain=forward.fqdn)
+        return resource_id
 
     def disable_http_resource_sso(self, resource_id: int) -> bool:
         url = f"{self.s.pangolin_api_url}/resource/{resource_id}"
@@ -189,7 +274,7 @@ class Pangolin:
             "sso": False
         }
 
-        response = requests.post(url, headers=self.headers, json=payload)
+        response = self._request('POST', url, json=payload)
         if not self._check_response_success(response):
             return False
 
@@ -204,11 +289,11 @@ class Pangolin:
             "enabled": True
         }
 
-        response = requests.put(url, headers=self.headers, json=payload)
-        if not self._check_response_success(response):
+        data = self._check_response_success(self._request('PUT', url, json=payload))
+        if not data:
             return None
 
-        return response.json().get('data', {}).get('targetId')
+        return data.get('data', {}).get('targetId')
 
     def create_pangolin_tcp_target(self, resource_id: int, forward: TCPForward) -> Optional[int]:
         url = f"{self.s.pangolin_api_url}/resource/{resource_id}/target"
@@ -219,11 +304,11 @@ class Pangolin:
             "enabled": True
         }
 
-        response = requests.put(url, headers=self.headers, json=payload)
-        if not self._check_response_success(response):
+        data = self._check_response_success(self._request('PUT', url, json=payload))
+        if not data:
             return None
 
-        return response.json().get('data', {}).get('targetId')
+        return data.get('data', {}).get('targetId')
 
     def create_pangolin_udp_target(self, resource_id: int, forward: UDPForward) -> Optional[int]:
         url = f"{self.s.pangolin_api_url}/resource/{resource_id}/target"
@@ -234,16 +319,16 @@ class Pangolin:
             "enabled": True
         }
 
-        response = requests.put(url, headers=self.headers, json=payload)
-        if not self._check_response_success(response):
+        data = self._check_response_success(self._request('PUT', url, json=payload))
+        if not data:
             return None
 
-        return response.json().get('data', {}).get('targetId')
+        return data.get('data', {}).get('targetId')
 
     def delete_resource(self, resource_id: int) -> bool:
         """Delete a resource from Pangolin"""
         url = f"{self.s.pangolin_api_url}/resource/{resource_id}"
-        response = requests.delete(url, headers=self.headers)
+        response = self._request('DELETE', url)
         if not self._check_response_success(response):
             return False
         return True
@@ -251,11 +336,10 @@ class Pangolin:
     def get_resource_targets(self, resource_id: int) -> Optional[list]:
         """Get targets for a resource"""
         url = f"{self.s.pangolin_api_url}/resource/{resource_id}/targets"
-        response = requests.get(url, headers=self.headers)
-        if not self._check_response_success(response):
+        data = self._check_response_success(self._request('GET', url))
+        if not data:
             return None
-        
-        data = response.json()
+
         return data.get('data', {}).get('targets', [])
 
     def _get_site_name_for_resource(self, resource: dict) -> str:
@@ -264,84 +348,101 @@ class Pangolin:
         return self.site_nice_id_cache.get(site_nice_id, "unknown") if site_nice_id else "unknown"
 
     def _format_resource_info(self, resource: dict, site_name: str) -> str:
-        """Format resource info string for logging"""
-        resource_id = resource.get('resourceId')
-        
+        """Format resource info string for logging, from the cached resource alone"""
         if resource.get('http', False):
             full_domain = resource.get('fullDomain', '').lower()
-            targets = self.get_resource_targets(resource_id) if resource_id else []
-            
-            if targets and targets[0]:
-                target = targets[0]
-                target_host = target.get('ip', 'unknown')
-                target_port = target.get('port', 'unknown')
-                method = target.get('method', 'unknown').lower()
-                return f"{full_domain}→ {method}://{target_host}:{target_port} ({site_name})"
-            else:
-                return f"{full_domain}→ unknown ({site_name})"
-                
+            return f"{full_domain} ({site_name})"
+
         elif resource.get('protocol') in ['tcp', 'udp']:
             protocol = resource.get('protocol').upper()
             proxy_port = resource.get('proxyPort')
-            targets = self.get_resource_targets(resource_id) if resource_id else []
-            
-            if targets and targets[0]:
-                target = targets[0]
-                target_host = target.get('ip', 'unknown')
-                target_port = target.get('port', 'unknown')
-                return f"{protocol}:{proxy_port}→ {target_host}:{target_port} ({site_name})"
-            else:
-                return f"{protocol}:{proxy_port}→ unknown ({site_name})"
-        
+            return f"{protocol}:{proxy_port} ({site_name})"
+
         return f"unknown resource ({site_name})"
 
-    def _is_resource_orphaned(self, resource: dict, valid_domains: set, valid_tcp_ports: set, valid_udp_ports: set) -> bool:
-        """Check if resource should be deleted as orphaned"""
-        if resource.get('http', False):
-            full_domain = resource.get('fullDomain', '').lower()
-            return full_domain and full_domain not in valid_domains
-            
-        elif resource.get('protocol') == 'tcp':
-            proxy_port = resource.get('proxyPort')
-            return proxy_port and proxy_port not in valid_tcp_ports
-            
-        elif resource.get('protocol') == 'udp':
-            proxy_port = resource.get('proxyPort')
-            return proxy_port and proxy_port not in valid_udp_ports
-            
-        return False
+    def _owner_keeps_resource(self, owner: str, key: Optional[str], valid_keys_by_owner: dict) -> bool:
+        if owner not in valid_keys_by_owner:
+            # No longer configured
+            return False
+
+        valid_keys = valid_keys_by_owner[owner]
+        # Owners whose discovery is unavailable keep all their resources
+        return valid_keys is None or key in valid_keys
 
-    def cleanup_orphaned_resources(self, valid_domains: set, valid_tcp_ports: set, valid_udp_ports: set) -> None:
-        """Remove resources from Pangolin that aren't in Traefik or static config"""
+    def cleanup_orphaned_resources(self, state: SyncState, valid_keys_by_owner: dict) -> None:
+        """Remove resources owned by this sync that none of their owners (Traefik sites or
+        static forwards) has anymore. valid_keys_by_owner maps each configured owner to
+        its resource keys, or to None if its discovery is unavailable."""
         if not self.resource_cache:
-            print("No resources in cache to clean up")
+            log.info("No resources in cache to clean up")
             return
 
+        state.prune_owned_resources({resource.get('resourceId') for resource in self.resource_cache})
+
         orphaned_resources = []
-        
+        owned_count = 0
+
         for resource in self.resource_cache:
             resource_id = resource.get('resourceId')
-            if not resource_id:
+            owners = state.get_resource_owners(resource_id) if resource_id else []
+            if not owners:
+                continue
+
+            owned_count += 1
+            key = self.get_resource_key(resource)
+            remaining_owners = [owner for owner in owners if self._owner_keeps_resource(owner, key, valid_keys_by_owner)]
+            if remaining_owners:
+                if remaining_owners != owners:
+                    state.set_resource_owners(resource_id, remaining_owners)
                 continue
 
-            if self._is_resource_orphaned(resource, valid_domains, valid_tcp_ports, valid_udp_ports):
-                site_name = self._get_site_name_for_resource(resource)
-                resource_info = self._format_resource_info(resource, site_name)
-                orphaned_resources.append((resource_id, resource_info))
+            site_name = self._get_site_name_for_resource(resource)
+            resource_info = self._format_resource_info(resource, site_name)
+            orphaned_resources.append((resource_id, resource_info))
 
-        deleted_count = 0
-        for resource_id, resource_info in orphaned_resources:
-            print(f"[{resource_info}] Deleting orphaned resource...")
+        if not orphaned_resources:
+            log.info("No orphaned resources found")
+            return
+
+        # A discovery glitch looks just like a lot of orphans, so refuse to delete too many at once
+        max_deletes = self.s.cleanup_max_deletes
+        max_delete_percent = self.s.cleanup_max_delete_percent
+        orphaned_percent = len(orphaned_resources) * 100 / owned_count
+        exceeded_limits = []
+        if max_deletes is not None and len(orphaned_resources) > max_deletes:
+            exceeded_limits.append(f"cleanup_max_deletes ({max_deletes})")
+        # Small installs would otherwise never get past the percentage with a single orphan
+        if (max_delete_percent is not None and orphaned_percent > max_delete_percent
+                and len(orphaned_resources) > self.s.cleanup_min_deletes):
+            exceeded_limits.append(f"cleanup_max_delete_percent ({max_delete_percent}%)")
+        if exceeded_limits:
+            log.warning("Found %s orphaned resources (%.0f%% of owned resources), more than allowed by %s. Aborting cleanup.",
+                        len(orphaned_resources), orphaned_percent, ' and '.join(exceeded_limits))
+            for _, resource_info in orphaned_resources:
+                log.warning("  %s", resource_info)
+            return
+
+        def delete_orphan(orphan: tuple) -> bool:
+            resource_id, resource_info = orphan
+            log.info("[%s] Deleting orphaned resource...", resource_info)
             if self.delete_resource(resource_id):
-                deleted_count += 1
-            else:
-                print(f"[{resource_info}] Failed to delete resource")
+                return True
+            log.error("[%s] Failed to delete resource", resource_info)
+            return False
+
+        with ThreadPoolExecutor(max_workers=max(1, self.s.cleanup_concurrency)) as executor:
+            deleted = list(executor.map(delete_orphan, orphaned_resources))
+
+        for (resource_id, _), success in zip(orphaned_resources, deleted):
+            if success:
+                state.set_resource_owners(resource_id, [])
+
+        deleted_count = sum(deleted)
+        self.stats['deleted'] += deleted_count
 
+        log.info("Deleted %s of %s orphaned resources", deleted_count, len(orphaned_resources))
         if deleted_count > 0:
-            print(f"Deleted {deleted_count} orphaned resources")
             self.resource_cache = []
-        else:
-            print("No orphaned resources found")
 
     def update_target(self, target_id: int, ip: str, port: int, method: str, enabled: bool = True) -> bool:
         """Update an existing target"""
@@ -353,7 +454,7 @@ class Pangolin:
             "enabled": enabled
         }
         
-        response = requests.post(url, headers=self.headers, json=payload)
+        response = self._request('POST', url, json=payload)
         if not self._check_response_success(response):
             return False
         return True
@@ -361,7 +462,7 @@ class Pangolin:
     def delete_target(self, target_id: int) -> bool:
         """Delete a target"""
         url = f"{self.s.pangolin_api_url}/target/{target_id}"
-        response = requests.delete(url, headers=self.headers)
+        response = self._request('DELETE', url)
         if not self._check_response_success(response):
             return False
         return True
@@ -398,7 +499,7 @@ class Pangolin:
         
         targets = self.get_resource_targets(resource_id)
         if not targets:
-            print(f"[{forward}] No targets found for existing resource")
+            log.error("[%s] No targets found for existing resource", forward)
             return False
         
         target = targets[0]
@@ -407,31 +508,33 @@ class Pangolin:
         
         # Check for differences
         if target.get('ip') != forward.target_host:
-            print(f"[{forward}] Target host changed: {target.get('ip')} → {forward.target_host}")
+            log.info("[%s] Target host changed: %s → %s", forward, target.get('ip'), forward.target_host)
             needs_update = True
         
         if target.get('port') != forward.target_port:
-            print(f"[{forward}] Target port changed: {target.get('port')} → {forward.target_port}")
+            log.info("[%s] Target port changed: %s → %s", forward, target.get('port'), forward.target_port)
             needs_update = True
         
         # Check method for HTTP forwards
         if hasattr(forward, 'target_method'):
             if target.get('method') != forward.target_method.value:
-                print(f"[{forward}] Target method changed: {target.get('method')} → {forward.target_method.value}")
+                log.info("[%s] Target method changed: %s → %s", forward, target.get('method'), forward.target_method.value)
                 needs_update = True
         
         # Update if needed
         if needs_update:
             if not target_id:
-                print(f"[{forward}] Cannot update - no target ID found")
+                log.error("[%s] Cannot update - no target ID found", forward)
                 return False
             
-            print(f"[{forward}] Updating existing resource configuration...")
+            log.info("[%s] Updating existing resource configuration...", forward)
+            self.stats['updated'] += 1
             method = getattr(forward, 'target_method', None)
             method_value = method.value if method else getattr(forward, 'protocol', 'TCP').upper()
             return self.update_target(target_id, forward.target_host, forward.target_port, method_value)
         else:
-            print(f"[{forward}] Configuration is up to date")
+            log.debug("[%s] Configuration is up to date", forward)
+            self.stats['unchanged'] += 1
             return True
 
     def compare_and_update_http_resource(self, forward: HTTPForward) -> bool:
@@ -439,6 +542,54 @@ class Pangolin:
         resource = self._find_resource_by_http_domain(forward.fqdn)
         return self._check_and_update_target(forward, resource) if resource else False
 
+    def compare_and_update_http_targets(self, forwards: list[HTTPForward]) -> bool:
+        """Diff the targets of an HTTP resource against one target per forward, reusing
+        mismatched targets for missing ones before creating or deleting the rest"""
+        resource = self._find_resource_by_http_domain(forwards[0].fqdn)
+        resource_id = resource.get('resourceId') if resource else None
+        if not resource_id:
+            return False
+
+        targets = self.get_resource_targets(resource_id)
+        if targets is None:
+            log.error("[%s] Failed fetching targets for existing resource", forwards[0].fqdn)
+            return False
+
+        desired = {(f.target_host, f.target_port, f.target_method.value): f for f in forwards}
+        matched = set()
+        unmatched_targets = []
+        for target in targets:
+            key = (target.get('ip'), target.get('port'), target.get('method'))
+            if key in desired and key not in matched:
+                matched.add(key)
+            else:
+                unmatched_targets.append(target)
+        missing_forwards = [forward for key, forward in desired.items() if key not in matched]
+
+        if not missing_forwards and not unmatched_targets:
+            log.debug("[%s] Configuration is up to date", forwards[0].fqdn)
+            self.stats['unchanged'] += 1
+            return True
+
+        self.stats['updated'] += 1
+        success = True
+        for forward in missing_forwards:
+            if unmatched_targets and unmatched_targets[0].get('targetId'):
+                target = unmatched_targets.pop(0)
+                log.info("[%s] Updating target %s://%s:%s...",
+                         forward, target.get('method'), target.get('ip'), target.get('port'))
+                success &= self.update_target(target['targetId'], forward.target_host, forward.target_port, forward.target_method.value)
+            else:
+                log.info("[%s] Creating HTTP target...", forward)
+                success &= self.create_pangolin_http_target(resource_id, forward) is not None
+
+        for target in unmatched_targets:
+            log.info("[%s] Deleting target %s://%s:%s...",
+                     forwards[0].fqdn, target.get('method'), target.get('ip'), target.get('port'))
+            success &= bool(target.get('targetId')) and self.delete_target(target['targetId'])
+
+        return success
+
     def compare_and_update_tcp_resource(self, forward: TCPForward) -> bool:
         """Compare TCP resource configuration and update if needed"""
         resource = self._find_resource_by_tcp_port(forward.source_port)
@@ -0,0 +1,91 @@
+import random
+from dataclasses import dataclass
+from typing import Optional
+from settings import Settings
+
+STATIC_FORWARDS = "static forwards"
+
+
+@dataclass
+class Schedule:
+    name: str
+    configured_interval: float
+    min_interval: float
+    max_interval: float
+    interval: float
+    next_run: float = 0
+    unchanged_runs: int = 0
+
+    def __str__(self) -> str:
+        return f"Schedule({self.name}: every {self.interval:.0f}s)"
+
+
+class Scheduler:
+    """Per-site sync intervals that back off while a site is unchanged and speed up after changes"""
+
+    def __init__(self, base_interval: int) -> None:
+        self.base_interval = base_interval
+        self.jitter = 0.0
+        self.backoff_after = 3
+        self.schedules = {}
+
+    def update_sites(self, s: Settings) -> None:
+        """Add schedules for new sites and drop the ones no longer configured"""
+        self.jitter = s.schedule_jitter
+        self.backoff_after = s.schedule_backoff_after
+
+        # Static forwards are synced in every cycle, they only need a schedule of their own without Traefik sites
+        wanted = {} if s.traefik_sites else {STATIC_FORWARDS: (self.base_interval, self.base_interval, self.base_interval)}
+        for traefik_site in s.traefik_sites:
+            interval = traefik_site.sync_interval or self.base_interval
+            min_interval = traefik_site.min_sync_interval or min(60, interval)
+            max_interval = traefik_site.max_sync_interval or interval * 4
+            wanted[traefik_site.name] = (interval, min_interval, max_interval)
+
+        for name in list(self.schedules):
+            if name not in wanted:
+                del self.schedules[name]
+
+        for name, (interval, min_interval, max_interval) in wanted.items():
+            schedule = self.schedules.get(name)
+            if schedule and (schedule.configured_interval, schedule.min_interval, schedule.max_interval) == (interval, min_interval, max_interval):
+                continue
+            # New or reconfigured sites are synced right away
+            self.schedules[name] = Schedule(name=name,
+                                            configured_interval=interval,
+                                            min_interval=min_interval,
+                                            max_interval=max_interval,
+                                            interval=interval)
+
+    def _jittered(self, interval: float) -> float:
+        return interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def due(self, now: float) -> list[str]:
+        """Sites due now, together with the ones due within their jitter window, so that sites
+        with similar intervals share a cycle (and its Pangolin listings and cleanup)"""
+        if not any(schedule.next_run <= now for schedule in self.schedules.values()):
+            return []
+        return [name for name, schedule in self.schedules.items()
+                if schedule.next_run <= now + schedule.interval * self.jitter]
+
+    def seconds_until_next_run(self, now: float) -> float:
+        if not self.schedules:
+            return self.base_interval
+        return max(0, min(schedule.next_run for schedule in self.schedules.values()) - now)
+
+    def record_run(self, name: str, changed: Optional[bool], now: float) -> None:
+        """Reschedule after a run, changed is None when the site could not be discovered"""
+        schedule = self.schedules.get(name)
+        if not schedule:
+            return
+
+        if changed:
+            schedule.unchanged_runs = 0
+            schedule.interval = schedule.min_interval
+        elif changed is not None:
+            schedule.unchanged_runs += 1
+            if schedule.unchanged_runs >= self.backoff_after:
+                schedule.interval = min(schedule.interval * 2, schedule.max_interval)
+
+        # Measured from the end of the run, so a slow run never overlaps the next one
+        schedule.next_run = now + self._jittered(schedule.interval)
@@ -1,7 +1,8 @@
+import os
 import yaml
 from pathlib import Path
-from typing import Dict, List, Any
-from models import HTTPForwardMethod, TraefikSite
+from typing import Dict, List, Any, Optional
+from models import HTTPForwardMethod, TraefikDiscoveryMode, TraefikSite
 
 
 class Settings:
@@ -15,6 +16,24 @@ class Settings:
         self.static_tcp_forwards: List[Dict[str, Any]]
         self.static_udp_forwards: List[Dict[str, Any]]
         self.cleanup_orphaned_resources: bool
+        self.pangolin_connect_timeout: float
+        self.pangolin_read_timeout: float
+        self.cycle_deadline: int
+        self.circuit_breaker_threshold: int
+        self.circuit_breaker_cooldown: int
+        self.state_file: str
+        self.schedule_jitter: float
+        self.schedule_backoff_after: int
+        self.failure_backoff_base: int
+        self.failure_backoff_max: int
+        self.cleanup_max_deletes: Optional[int]
+        self.cleanup_max_delete_percent: Optional[float]
+        self.cleanup_min_deletes: int
+        self.cleanup_concurrency: int
+        self.status_api_address: str
+        self.status_api_port: Optional[int]
+        self.log_level: str
+        self.log_format: str
 
         if yaml_path is None:
             yaml_path = Path(__file__).parent / 'settings.yml'
@@ -34,6 +53,24 @@ class Settings:
         self.static_tcp_forwards = getattr(self, 'static_tcp_forwards') or []
         self.static_udp_forwards = getattr(self, 'static_udp_forwards') or []
         self.cleanup_orphaned_resources = getattr(self, 'cleanup_orphaned_resources', False)
+        self.pangolin_connect_timeout = getattr(self, 'pangolin_connect_timeout', 5)
+        self.pangolin_read_timeout = getattr(self, 'pangolin_read_timeout', 30)
+        self.cycle_deadline = getattr(self, 'cycle_deadline', 240)
+        self.circuit_breaker_threshold = getattr(self, 'circuit_breaker_threshold', 3)
+        self.circuit_breaker_cooldown = getattr(self, 'circuit_breaker_cooldown', 900)
+        self.state_file = getattr(self, 'state_file', os.environ.get('STATE_FILE', str(Path(__file__).parent / 'state.json')))
+        self.schedule_jitter = getattr(self, 'schedule_jitter', 0.1)
+        self.schedule_backoff_after = getattr(self, 'schedule_backoff_after', 3)
+        self.failure_backoff_base = getattr(self, 'failure_backoff_base', 300)
+        self.failure_backoff_max = getattr(self, 'failure_backoff_max', 21600)
+        self.cleanup_max_deletes = getattr(self, 'cleanup_max_deletes', 25)
+        self.cleanup_max_delete_percent = getattr(self, 'cleanup_max_delete_percent', 25)
+        self.cleanup_min_deletes = getattr(self, 'cleanup_min_deletes', 3)
+        self.cleanup_concurrency = getattr(self, 'cleanup_concurrency', 8)
+        self.status_api_address = getattr(self, 'status_api_address', '127.0.0.1')
+        self.status_api_port = getattr(self, 'status_api_port', 8780)
+        self.log_level = getattr(self, 'log_level', 'INFO')
+        self.log_format = getattr(self, 'log_format', 'text')
 
         # Convert traefik_sites from dict to TraefikSite instances
         traefik_sites_raw = getattr(self, 'traefik_sites') or []
@@ -41,11 +78,29 @@ class Settings:
             TraefikSite(
                 site_name=site['site_name'],
                 api_url=site['api_url'],
-                api_http_routers_path=site['api_http_routers_path'],
+                api_http_routers_path=site.get('api_http_routers_path', '/http/routers'),
                 target_host=site['target_host'],
                 target_port=site['target_port'],
                 target_method=HTTPForwardMethod(site['target_method'].upper()),
-                host_whitelist=site.get('host_whitelist', [])
+                host_whitelist=site.get('host_whitelist', []),
+                connect_timeout=site.get('connect_timeout', 5),
+                read_timeout=site.get('read_timeout', 10),
+                discovery_mode=TraefikDiscoveryMode(site.get('discovery_mode', 'routers').upper()),
+                api_rawdata_path=site.get('api_rawdata_path', '/rawdata'),
+                api_entrypoints_path=site.get('api_entrypoints_path', '/entrypoints'),
+                entrypoint_ports=site.get('entrypoint_ports') or {},
+                entrypoint_whitelist=site.get('entrypoint_whitelist', []),
+                sync_interval=site.get('sync_interval'),
+                min_sync_interval=site.get('min_sync_interval'),
+                max_sync_interval=site.get('max_sync_interval'),
+                name=site.get('name')
             )
             for site in traefik_sites_raw
         ]
+
+        # Discoveries, ownership and schedules are kept per Traefik instance
+        names = [traefik_site.name for traefik_site in self.traefik_sites]
+        duplicate_names = sorted({name for name in names if names.count(name) > 1})
+        if duplicate_names:
+            raise ValueError(f"Duplicate Traefik site names {', '.join(duplicate_names)}: "
+                             f"set a unique 'name' on traefik_sites that share a site_name")
@@ -0,0 +1,176 @@
+import fcntl
+import logging
+import time
+from contextlib import contextmanager
+from dataclasses import asdict
+from pathlib import Path
+from typing import Iterator, Optional
+import json_codec
+from models import ForwardFailure, TCPForward, UDPForward
+
+log = logging.getLogger(__name__)
+
+
+class SyncState:
+    """Sync state persisted between runs (last good Traefik discoveries, circuit breakers,
+    failing forwards, resources owned by this sync)"""
+
+    def __init__(self, path: str) -> None:
+        self.path = Path(path)
+        self._load()
+
+    def _load(self) -> None:
+        self.sites = {}
+        self.forward_failures = {}
+        self.owned_resources = {}
+        try:
+            with open(self.path, 'rb') as file:
+                data = json_codec.loads(file.read())
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            log.warning("Unable to load sync state from %s: %s", self.path, e)
+            return
+
+        self.sites = data.get('sites', {})
+        self.forward_failures = data.get('forward_failures', {})
+        self.owned_resources = data.get('owned_resources', {})
+
+    def save(self) -> None:
+        tmp_path = self.path.with_suffix(self.path.suffix + '.tmp')
+        try:
+            with open(tmp_path, 'wb') as file:
+                file.write(json_codec.dumps({'sites': self.sites,
+                                             'forward_failures': self.forward_failures,
+                                             'owned_resources': self.owned_resources}))
+            tmp_path.replace(self.path)
+        except OSError as e:
+            log.warning("Unable to save sync state to %s: %s", self.path, e)
+
+    @contextmanager
+    def lock(self) -> Iterator[bool]:
+        """Hold an exclusive lock on the state for one cycle, yields False if another process has it.
+        The state is reloaded once locked, another process may have saved it in the meantime."""
+        lock_path = self.path.with_suffix(self.path.suffix + '.lock')
+        with open(lock_path, 'w') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+
+            try:
+                self._load()
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _site(self, name: str) -> dict:
+        return self.sites.setdefault(name, {'failures': 0, 'open_until': 0})
+
+    def get_last_good_discovery(self, name: str) -> Optional[tuple]:
+        """Hosts and TCP/UDP forwards from the last successful discovery of a Traefik instance,
+        or None if there never was one"""
+        site = self.sites.get(name, {})
+        if 'hosts' not in site:
+            return None
+
+        tcp_forwards = [TCPForward(**f) for f in site.get('tcp_forwards', [])]
+        udp_forwards = [UDPForward(**f) for f in site.get('udp_forwards', [])]
+        return site['hosts'], tcp_forwards, udp_forwards
+
+    def is_circuit_open(self, name: str) -> bool:
+        return self.sites.get(name, {}).get('open_until', 0) > time.time()
+
+    def get_entrypoint_ports(self, name: str) -> dict:
+        """Entrypoint ports last fetched from a Traefik instance"""
+        return self.sites.get(name, {}).get('entrypoint_ports', {})
+
+    def record_site_success(self, name: str, hosts: list, tcp_forwards: list, udp_forwards: list,
+                            entrypoint_ports: Optional[dict] = None) -> bool:
+        """Store a successful discovery, returns True if its hosts or forwards differ from the previous one"""
+        site = self._site(name)
+        site['entrypoint_ports'] = entrypoint_ports or {}
+        previous = (site.get('hosts'), site.get('tcp_forwards'), site.get('udp_forwards'))
+        site['hosts'] = sorted(hosts)
+        site['tcp_forwards'] = [asdict(f) for f in tcp_forwards]
+        site['udp_forwards'] = [asdict(f) for f in udp_forwards]
+        site['failures'] = 0
+        site['open_until'] = 0
+        return previous != (site['hosts'], site['tcp_forwards'], site['udp_forwards'])
+
+    def record_site_failure(self, name: str, threshold: int, cooldown: int) -> bool:
+        """Count a failed discovery, returns True if the circuit breaker opened"""
+        site = self._site(name)
+        site['failures'] += 1
+        if site['failures'] >= threshold:
+            site['open_until'] = time.time() + cooldown
+            return True
+        return False
+
+    def get_forward_failure(self, key: str, description: str) -> Optional[dict]:
+        """The failure of a forward that is still backing off. A changed forward is retried right away."""
+        failure = self.forward_failures.get(key)
+        if not failure:
+            return None
+
+        if failure['description'] != description or failure['retry_at'] <= time.time():
+            return None
+
+        return failure
+
+    def record_forward_failure(self, key: str, description: str, failure: ForwardFailure,
+                               backoff_base: int, backoff_max: int) -> int:
+        """Remember a failed forward, returns the seconds until it will be retried"""
+        previous = self.forward_failures.get(key, {})
+        attempts = previous.get('attempts', 0) + 1 if previous.get('description') == description else 1
+        backoff = min(backoff_base * 2 ** (attempts - 1), backoff_max)
+        self.forward_failures[key] = {
+            'description': description,
+            'reason': failure.reason,
+            'dependency': failure.dependency,
+            'attempts': attempts,
+            'retry_at': time.time() + backoff
+        }
+        return backoff
+
+    def clear_forward_failure(self, key: str) -> None:
+        self.forward_failures.pop(key, None)
+
+    def clear_resolved_forward_failures(self, domains: set, sites: set) -> None:
+        """Retry forwards whose missing domain or site exists now"""
+        available = {f"domain:{domain}" for domain in domains} | {f"site:{site}" for site in sites}
+        for key, failure in list(self.forward_failures.items()):
+            if failure.get('dependency') in available:
+                del self.forward_failures[key]
+
+    def get_resource_owners(self, resource_id: int) -> list:
+        """The Traefik instances (by name, or static forwards) a resource was synced for, empty if
+        this sync doesn't own it"""
+        return self.owned_resources.get(str(resource_id), {}).get('owners', [])
+
+    def adopt_resources(self, resources_by_key: dict, valid_keys_by_owner: dict) -> None:
+        """Record ownership of every resource matching a forward of a configured owner"""
+        for owner, valid_keys in valid_keys_by_owner.items():
+            for key in valid_keys or ():
+                resource_id = resources_by_key.get(key, {}).get('resourceId')
+                if not resource_id:
+                    continue
+
+                owned = self.owned_resources.setdefault(str(resource_id), {'key': key, 'owners': []})
+                owned['key'] = key
+                if owner not in owned['owners']:
+                    owned['owners'].append(owner)
+
+    def set_resource_owners(self, resource_id: int, owners: list) -> None:
+        if owners:
+            self.owned_resources[str(resource_id)]['owners'] = owners
+        else:
+            self.owned_resources.pop(str(resource_id), None)
+
+    def prune_owned_resources(self, existing_resource_ids: set) -> None:
+        """Forget owned resources that no longer exist in Pangolin"""
+        existing = {str(resource_id) for resource_id in existing_resource_ids}
+        for resource_id in list(self.owned_resources):
+            if resource_id not in existing:
+                del self.owned_resources[resource_id]
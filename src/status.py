@@ -0,0 +1,158 @@
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import unquote
+import json_codec
+from scheduler import STATIC_FORWARDS
+
+log = logging.getLogger(__name__)
+
+
+class SyncStatus:
+    """In-memory view of what the sync knows about each resource key, for the status API.
+    Written by the sync loop, read by the API threads."""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.forwards = {}
+        self.rejected_hosts = {}
+        self.sites = {}
+        self.failures = {}
+        self.last_cycle = None
+
+    def _forward(self, key: str) -> dict:
+        return self.forwards.setdefault(key, {'key': key, 'sources': [], 'resource_id': None,
+                                              'targets': [], 'last_result': None, 'last_synced': None})
+
+    def record_discovery(self, source: str, keys: Optional[set], rejected_hosts: Optional[list], status: str) -> None:
+        """Replace the resource keys a Traefik site (or the static forwards) contributes and
+        the hosts its whitelist rejected. None leaves the previous keys or hosts alone."""
+        with self.lock:
+            self.sites[source] = {'name': source, 'status': status, 'updated': time.time(),
+                                  'resources': len(keys) if keys is not None else None}
+            if keys is not None:
+                for key, forward in self.forwards.items():
+                    if source in forward['sources'] and key not in keys:
+                        forward['sources'].remove(source)
+                for key in keys:
+                    forward = self._forward(key)
+                    if source not in forward['sources']:
+                        forward['sources'].append(source)
+
+            if rejected_hosts is None:
+                return
+
+            for host, sources in list(self.rejected_hosts.items()):
+                sources.discard(source)
+                if not sources:
+                    del self.rejected_hosts[host]
+            for host in rejected_hosts:
+                self.rejected_hosts.setdefault(host.lower(), set()).add(source)
+
+    def record_result(self, key: str, targets: list, result: str) -> None:
+        """Record the outcome of syncing a forward: synced, failed or backing off"""
+        with self.lock:
+            forward = self._forward(key)
+            forward['targets'] = targets
+            forward['last_result'] = result
+            forward['last_synced'] = time.time()
+
+    def record_cycle(self, resources_by_key: dict, forward_failures: dict) -> None:
+        """Publish the resource IDs and pending failures at the end of a cycle"""
+        with self.lock:
+            for key, forward in list(self.forwards.items()):
+                if not forward['sources']:
+                    del self.forwards[key]
+                    continue
+                forward['resource_id'] = resources_by_key.get(key, {}).get('resourceId')
+            self.failures = {key: dict(failure) for key, failure in forward_failures.items()}
+            self.last_cycle = time.time()
+
+    def get_forward(self, key: str) -> Optional[dict]:
+        with self.lock:
+            forward = self.forwards.get(key)
+            failure = self.failures.get(key)
+            if not forward and not failure:
+                return None
+
+            result = dict(forward or {'key': key, 'sources': []})
+            result['sources'] = list(result['sources'])
+            result['failure'] = failure
+            return result
+
+    def get_host(self, fqdn: str) -> Optional[dict]:
+        fqdn = fqdn.lower()
+        result = self.get_forward(f"http:{fqdn}")
+        with self.lock:
+            rejected_by = sorted(self.rejected_hosts.get(fqdn, ()))
+        if not result and not rejected_by:
+            return None
+
+        result = result or {'key': f"http:{fqdn}", 'sources': []}
+        result['whitelisted'] = any(source != STATIC_FORWARDS for source in result['sources'])
+        result['rejected_by_whitelist_of'] = rejected_by
+        return result
+
+    def get_summary(self) -> dict:
+        with self.lock:
+            return {'last_cycle': self.last_cycle,
+                    'forwards': len(self.forwards),
+                    'pending_failures': len(self.failures),
+                    'sites': list(self.sites.values())}
+
+    def get_failures(self) -> dict:
+        with self.lock:
+            return dict(self.failures)
+
+
+class StatusAPI:
+    """Read-only HTTP/JSON API over a SyncStatus, served from memory only:
+
+    GET /status                  summary and per-site discovery status
+    GET /hosts/<fqdn>            sources, whitelist match, resource ID, targets, last result, failure
+    GET /forwards/<tcp|udp>/<port>
+    GET /failures                forwards backing off after a failure
+    """
+
+    def __init__(self, status: SyncStatus, address: str, port: int) -> None:
+        self.status = status
+        self.server = ThreadingHTTPServer((address, port), self._make_handler())
+        self.server.daemon_threads = True
+
+    def _route(self, path: str) -> Optional[object]:
+        parts = [unquote(part) for part in path.split('?')[0].strip('/').split('/')]
+        if parts == ['status']:
+            return self.status.get_summary()
+        if parts == ['failures']:
+            return self.status.get_failures()
+        if len(parts) == 2 and parts[0] == 'hosts':
+            return self.status.get_host(parts[1])
+        if len(parts) == 3 and parts[0] == 'forwards' and parts[1] in ('tcp', 'udp'):
+            return self.status.get_forward(f"{parts[1]}:{parts[2]}")
+        return None
+
+    def _make_handler(self) -> type:
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                result = api._route(self.path)
+                code = 200 if result is not None else 404
+                body = json_codec.dumps(result if result is not None else {'error': 'not found'})
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args) -> None:
+                pass
+
+        return Handler
+
+    def start(self) -> None:
+        address, port = self.server.server_address[:2]
+        log.info("Serving status API on http://%s:%s", address, port)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
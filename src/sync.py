@@ -1,78 +1,108 @@
-from typing import Optional
+import logging
+import time
+from typing import Callable, Optional
 from models import HTTPForward, TCPForward, UDPForward, HTTPForwardMethod, TraefikSite
 from settings import Settings
+from state import SyncState
+from status import SyncStatus
 from pangolin_client import Pangolin
 from traefik_client import Traefik
 
+log = logging.getLogger(__name__)
+
 
 class Sync:
-    def __init__(self, s: Settings, p: Pangolin, t: Optional[Traefik] = None) -> None:
+    def __init__(self, s: Settings, p: Pangolin, t: Optional[Traefik] = None, deadline: Optional[float] = None,
+                 state: Optional[SyncState] = None, status: Optional[SyncStatus] = None) -> None:
         self.s = s
         self.p = p
         self.t = t
-
-    def _make_http_forward(self, forward: HTTPForward) -> None:
-        print(f"[{forward}] Creating HTTP resource...")
-        resource_id = self.p.create_pangolin_http_resource(forward)
+        self.deadline = deadline
+        self.state = state
+        self.status = status
+
+    def deadline_exceeded(self) -> bool:
+        """Check the cycle deadline (a time.monotonic() timestamp)"""
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def _describe_http_forwards(self, forwards: list[HTTPForward]) -> str:
+        if len(forwards) == 1:
+            return str(forwards[0])
+        targets = ", ".join(f"{f.target_method.value.lower()}://{f.target_host}:{f.target_port} ({f.site_name})" for f in forwards)
+        return f"{forwards[0].fqdn}→ {targets}"
+
+    def _make_http_forward(self, forwards: list[HTTPForward]) -> bool:
+        """Create an HTTP resource in the first forward's site, with one target per forward"""
+        description = self._describe_http_forwards(forwards)
+        log.info("[%s] Creating HTTP resource...", description)
+        resource_id = self.p.create_pangolin_http_resource(forwards[0])
         if not resource_id:
-            print(f"[{forward}] Failed creating the resource")
-            return
+            log.error("[%s] Failed creating the resource", description)
+            return False
 
-        print(f"[{forward}] Disabling SSO...")
+        log.info("[%s] Disabling SSO...", description)
         disable_sso_success = self.p.disable_http_resource_sso(resource_id)
         if not disable_sso_success:
-            print(f"[{forward}] Failed disabling SSO for the resource")
-            return
+            log.error("[%s] Failed disabling SSO for the resource", description)
+            return False
 
-        print(f"[{forward}] Creating HTTP target...")
-        target_id = self.p.create_pangolin_http_target(resource_id, forward)
-        if not target_id:
-            print(f"[{forward}] Failed creating target for the resource")
-            return
+        for forward in forwards:
+            log.info("[%s] Creating HTTP target...", forward)
+            target_id = self.p.create_pangolin_http_target(resource_id, forward)
+            if not target_id:
+                log.error("[%s] Failed creating target for the resource", forward)
+                return False
 
-    def _make_tcp_forward(self, forward: TCPForward) -> None:
-        print(f"[{forward}] Creating TCP resource...")
+        return True
+
+    def _make_tcp_forward(self, forward: TCPForward) -> bool:
+        log.info("[%s] Creating TCP resource...", forward)
         resource_id = self.p.create_pangolin_tcp_resource(forward)
         if not resource_id:
-            print(f"[{forward}] Failed creating the resource")
-            return
+            log.error("[%s] Failed creating the resource", forward)
+            return False
 
-        print(f"[{forward}] Creating TCP target...")
+        log.info("[%s] Creating TCP target...", forward)
         target_id = self.p.create_pangolin_tcp_target(resource_id, forward)
         if not target_id:
-            print(f"[{forward}] Failed creating target for the resource")
-            return
+            log.error("[%s] Failed creating target for the resource", forward)
+            return False
 
-    def _make_udp_forward(self, forward: UDPForward) -> None:
-        print(f"[{forward}] Creating UDP resource...")
+        return True
+
+    def _make_udp_forward(self, forward: UDPForward) -> bool:
+        log.info("[%s] Creating UDP resource...", forward)
         resource_id = self.p.create_pangolin_udp_resource(forward)
         if not resource_id:
-            print(f"[{forward}] Failed creating the resource")
-            return
+            log.error("[%s] Failed creating the resource", forward)
+            return False
 
-        print(f"[{forward}] Creating UDP target...")
+        log.info("[%s] Creating UDP target...", forward)
         target_id = self.p.create_pangolin_udp_target(resource_id, forward)
         if not target_id:
-            print(f"[{forward}] Failed creating target for the resource")
-            return
+            log.error("[%s] Failed creating target for the resource", forward)
+            return False
+
+        return True
 
-    def _build_httpforward_obj_from_dynamic(self, dynamic_http_forward_entry: str) -> Optional[HTTPForward]:
+    def _build_httpforward_obj_from_dynamic(self, dynamic_http_forward_entry: str, t: Traefik) -> Optional[HTTPForward]:
         parts = dynamic_http_forward_entry.split('.')
         domain = '.'.join(parts[-2:])
         subdomain = parts[0]
 
         return HTTPForward(subdomain=subdomain,
                            domain=domain,
-                           site_name=self.t.site_name,
-                           target_host=self.t.traefik_site.target_host,
-                           target_port=self.t.traefik_site.target_port,
-                           target_method=self.t.traefik_site.target_method)
+                           site_name=t.site_name,
+                           target_host=t.traefik_site.target_host,
+                           target_port=t.traefik_site.target_port,
+                           target_method=t.traefik_site.target_method)
 
     def _build_httpforward_obj_from_static(self, static_http_forward_entry: dict) -> Optional[HTTPForward]:
         # Use explicit site_name if provided in settings, otherwise fallback to domain mapping
         site_name = static_http_forward_entry.get('site_name')
         if not site_name:
-            print(f"Error: Unable to create resource for {static_http_forward_entry['subdomain']}.{static_http_forward_entry['domain']}. No site_name provided")
+            log.error("Unable to create resource for %s.%s. No site_name provided",
+                      static_http_forward_entry['subdomain'], static_http_forward_entry['domain'])
             return
 
         target_method = static_http_forward_entry.get('target_method', 'HTTPS').upper()
@@ -98,90 +128,198 @@ class Sync:
                                target_host=static_udp_forward_entry['target_host'],
                                target_port=static_udp_forward_entry['target_port'])
 
-    def _sync_dynamic_http_forwards(self) -> None:
-        for dynamic_http_forward_entry in self.t.get_hosts():
-            dynamic_http_forward = self._build_httpforward_obj_from_dynamic(dynamic_http_forward_entry)
-
-            if not dynamic_http_forward:
-                print(f"Error: Failed building HTTPForward object for Traefik host {dynamic_http_forward_entry}")
-                continue
-
-            if self.p.check_domain_in_resource_cache(dynamic_http_forward.fqdn):
-                print(f"[{dynamic_http_forward}] Already in Pangolin. Checking configuration...")
-                self.p.compare_and_update_http_resource(dynamic_http_forward)
+    def _group_dynamic_http_forwards(self, traefiks: list[Traefik]) -> dict:
+        """Map each discovered FQDN to its forwards, one per Traefik site serving it"""
+        grouped = {}
+        for t in traefiks:
+            for dynamic_http_forward_entry in t.get_hosts():
+                dynamic_http_forward = self._build_httpforward_obj_from_dynamic(dynamic_http_forward_entry, t)
+
+                if not dynamic_http_forward:
+                    log.error("Failed building HTTPForward object for Traefik host %s", dynamic_http_forward_entry)
+                    continue
+
+                grouped.setdefault(dynamic_http_forward.fqdn.lower(), []).append((dynamic_http_forward, t.stale))
+        return grouped
+
+    def _sync_dynamic_http_forwards(self, traefiks: list[Traefik]) -> None:
+        for fqdn, entries in self._group_dynamic_http_forwards(traefiks).items():
+            if self.deadline_exceeded():
+                log.warning("Cycle deadline exceeded, deferring remaining forwards to the next run")
+                return
+
+            # Targets are reached through the resource's site, so only instances in the same
+            # Pangolin site as the first one serving the host can be merged
+            site_name = entries[0][0].site_name
+            other_site_names = sorted({forward.site_name for forward, _ in entries} - {site_name})
+            if other_site_names:
+                log.warning("[%s] Also served in Pangolin sites %s, only syncing its targets in site %s",
+                            fqdn, ', '.join(other_site_names), site_name)
+                entries = [(forward, stale) for forward, stale in entries if forward.site_name == site_name]
+
+            # Hosts only known from stale discoveries are left alone until one of their sites is synced
+            if all(stale for _, stale in entries):
                 continue
 
-            self._make_http_forward(dynamic_http_forward)
+            dynamic_http_forwards = [forward for forward, _ in entries]
+            self._attempt_forward(f"http:{fqdn}", dynamic_http_forwards,
+                                  lambda: self._sync_http_forward(dynamic_http_forwards))
 
     def _sync_static_http_forwards(self, static_http_forwards: list) -> None:
         for static_http_forward_entry in static_http_forwards:
+            if self.deadline_exceeded():
+                log.warning("Cycle deadline exceeded, deferring remaining forwards to the next run")
+                return
+
             static_http_forward = self._build_httpforward_obj_from_static(static_http_forward_entry)
 
             if not static_http_forward:
                 fqdn = f"{static_http_forward_entry['subdomain']}.{static_http_forward_entry['domain']}"
-                print(f"Error: Failed building HTTPForward object for static host {fqdn}")
-                continue
-
-            if self.p.check_domain_in_resource_cache(static_http_forward.fqdn):
-                print(f"[{static_http_forward}] Already in Pangolin. Checking configuration...")
-                self.p.compare_and_update_http_resource(static_http_forward)
+                log.error("Failed building HTTPForward object for static host %s", fqdn)
                 continue
 
-            self._make_http_forward(static_http_forward)
+            self._attempt_forward(f"http:{static_http_forward.fqdn.lower()}", [static_http_forward],
+                                  lambda: self._sync_static_http_forward(static_http_forward))
 
     def _sync_static_tcp_forwards(self, static_tcp_forwards: list) -> None:
         for static_tcp_forward_entry in static_tcp_forwards:
+            if self.deadline_exceeded():
+                log.warning("Cycle deadline exceeded, deferring remaining forwards to the next run")
+                return
+
             static_tcp_forward = self._build_tcpforward_obj_from_static(static_tcp_forward_entry)
 
             if not static_tcp_forward:
-                print(f"Error: Failed building TCPForward object for static port {static_tcp_forward_entry['source_port']}")
+                log.error("Failed building TCPForward object for static port %s", static_tcp_forward_entry['source_port'])
                 continue
 
-            if self.p.check_tcp_forward_in_resource_cache(static_tcp_forward.source_port):
-                print(f"[{static_tcp_forward}] Already in Pangolin. Checking configuration...")
-                self.p.compare_and_update_tcp_resource(static_tcp_forward)
-                continue
-
-            self._make_tcp_forward(static_tcp_forward)
+            self._attempt_forward(f"tcp:{static_tcp_forward.source_port}", [static_tcp_forward],
+                                  lambda: self._sync_tcp_forward(static_tcp_forward))
 
     def _sync_static_udp_forwards(self, static_udp_forwards: list) -> None:
         for static_udp_forward_entry in static_udp_forwards:
+            if self.deadline_exceeded():
+                log.warning("Cycle deadline exceeded, deferring remaining forwards to the next run")
+                return
+
             static_udp_forward = self._build_udpforward_obj_from_static(static_udp_forward_entry)
 
             if not static_udp_forward:
-                print(f"Error: Failed building UDPForward object for static port {static_udp_forward_entry['source_port']}")
+                log.error("Failed building UDPForward object for static port %s", static_udp_forward_entry['source_port'])
                 continue
 
-            if self.p.check_udp_forward_in_resource_cache(static_udp_forward.source_port):
-                print(f"[{static_udp_forward}] Already in Pangolin. Checking configuration...")
-                self.p.compare_and_update_udp_resource(static_udp_forward)
-                continue
+            self._attempt_forward(f"udp:{static_udp_forward.source_port}", [static_udp_forward],
+                                  lambda: self._sync_udp_forward(static_udp_forward))
+
+    def _record_result(self, key: str, forwards: list, result: str) -> None:
+        if self.status:
+            targets = [{'site_name': f.site_name, 'target_host': f.target_host, 'target_port': f.target_port,
+                        'target_method': f.target_method.value if isinstance(f, HTTPForward) else None}
+                       for f in forwards]
+            self.status.record_result(key, targets, result)
+
+    def _attempt_forward(self, key: str, forwards: list, sync_forward: Callable[[], bool]) -> None:
+        """Sync a forward (for HTTP, one target per forward) unless it is backing off after a
+        failure that would repeat"""
+        description = self._describe_http_forwards(forwards) if isinstance(forwards[0], HTTPForward) else str(forwards[0])
+        if self.state:
+            failure = self.state.get_forward_failure(key, description)
+            if failure:
+                log.debug("[%s] Skipping, failed %s times: %s", description, failure['attempts'], failure['reason'])
+                self._record_result(key, forwards, "backing off")
+                self.p.stats['backing_off'] += 1
+                return
+
+        self.p.last_failure = None
+        if sync_forward():
+            self._record_result(key, forwards, "synced")
+            if self.state:
+                self.state.clear_forward_failure(key)
+            return
 
-            self._make_udp_forward(static_udp_forward)
+        self._record_result(key, forwards, "failed")
+        self.p.stats['failed'] += 1
+        if self.state and self.p.last_failure:
+            retry_in = self.state.record_forward_failure(key, description, self.p.last_failure,
+                                                         self.s.failure_backoff_base, self.s.failure_backoff_max)
+            log.warning("[%s] Failed: %s. Retrying in %s seconds", description, self.p.last_failure.reason, retry_in)
 
-    def sync_traefik_hosts(self) -> None:
-        """Sync hosts discovered from Traefik site"""
-        if not self.t:
-            print("Error: No Traefik client available for host discovery")
-            return
+    def _sync_http_forward(self, http_forwards: list[HTTPForward]) -> bool:
+        if self.p.check_domain_in_resource_cache(http_forwards[0].fqdn):
+            log.debug("[%s] Already in Pangolin. Checking configuration...", http_forwards[0].fqdn)
+            return self.p.compare_and_update_http_targets(http_forwards)
 
-        hosts = self.t.get_hosts()
-        if not hosts:
-            print(f"WARNING: No Traefik hosts found for site {self.t.site_name}")
-            return
+        return self._make_http_forward(http_forwards)
+
+    def _sync_static_http_forward(self, static_http_forward: HTTPForward) -> bool:
+        if self.p.check_domain_in_resource_cache(static_http_forward.fqdn):
+            log.debug("[%s] Already in Pangolin. Checking configuration...", static_http_forward)
+            return self.p.compare_and_update_http_resource(static_http_forward)
+
+        return self._make_http_forward([static_http_forward])
+
+    def _sync_tcp_forward(self, tcp_forward: TCPForward) -> bool:
+        if self.p.check_tcp_forward_in_resource_cache(tcp_forward.source_port):
+            log.debug("[%s] Already in Pangolin. Checking configuration...", tcp_forward)
+            return self.p.compare_and_update_tcp_resource(tcp_forward)
+
+        return self._make_tcp_forward(tcp_forward)
 
-        print(f"\n>>> Creating HTTP Forwards (discovered from Traefik site: {self.t.site_name})...")
-        self._sync_dynamic_http_forwards()
+    def _sync_udp_forward(self, udp_forward: UDPForward) -> bool:
+        if self.p.check_udp_forward_in_resource_cache(udp_forward.source_port):
+            log.debug("[%s] Already in Pangolin. Checking configuration...", udp_forward)
+            return self.p.compare_and_update_udp_resource(udp_forward)
+
+        return self._make_udp_forward(udp_forward)
+
+    def _sync_dynamic_tcp_forwards(self, t: Traefik) -> None:
+        for dynamic_tcp_forward in t.get_tcp_forwards():
+            if self.deadline_exceeded():
+                log.warning("Cycle deadline exceeded, deferring remaining forwards to the next run")
+                return
+
+            self._attempt_forward(f"tcp:{dynamic_tcp_forward.source_port}", [dynamic_tcp_forward],
+                                  lambda: self._sync_tcp_forward(dynamic_tcp_forward))
+
+    def _sync_dynamic_udp_forwards(self, t: Traefik) -> None:
+        for dynamic_udp_forward in t.get_udp_forwards():
+            if self.deadline_exceeded():
+                log.warning("Cycle deadline exceeded, deferring remaining forwards to the next run")
+                return
+
+            self._attempt_forward(f"udp:{dynamic_udp_forward.source_port}", [dynamic_udp_forward],
+                                  lambda: self._sync_udp_forward(dynamic_udp_forward))
+
+    def sync_traefik_sites(self, traefiks: list[Traefik]) -> None:
+        """Sync hosts and TCP/UDP forwards discovered from Traefik sites. A host served by
+        several sites becomes one resource with a target per site. Stale discoveries only
+        contribute targets to hosts that are also served by a freshly discovered site."""
+        fresh_traefiks = [t for t in traefiks if not t.stale]
+        for t in fresh_traefiks:
+            if not t.get_hosts():
+                log.warning("No Traefik hosts found for site %s", t.name)
+
+        log.info(">>> Creating HTTP Forwards (discovered from Traefik sites)...")
+        self._sync_dynamic_http_forwards(traefiks)
+
+        for t in fresh_traefiks:
+            if t.get_tcp_forwards():
+                log.info(">>> Creating TCP Forwards (discovered from Traefik site: %s)...", t.name)
+                self._sync_dynamic_tcp_forwards(t)
+
+            if t.get_udp_forwards():
+                log.info(">>> Creating UDP Forwards (discovered from Traefik site: %s)...", t.name)
+                self._sync_dynamic_udp_forwards(t)
 
     def sync_static_forwards(self, static_http_forwards: list, static_tcp_forwards: list, static_udp_forwards: list) -> None:
         """Sync static forwards"""
-        print("\n>>> Creating static HTTP Forwards...")
+        log.info(">>> Creating static HTTP Forwards...")
         self._sync_static_http_forwards(static_http_forwards)
 
-        print("\n>>> Creating static TCP Forwards...")
+        log.info(">>> Creating static TCP Forwards...")
         self._sync_static_tcp_forwards(static_tcp_forwards)
 
-        print("\n>>> Creating static UDP Forwards...")
+        log.info(">>> Creating static UDP Forwards...")
         self._sync_static_udp_forwards(static_udp_forwards)
 
     def get_valid_resources(self, static_http_forwards: list, static_tcp_forwards: list, static_udp_forwards: list) -> tuple:
@@ -192,10 +330,13 @@ class Sync:
 
         if self.t:
             for dynamic_http_forward_entry in self.t.get_hosts():
-                dynamic_http_forward = self._build_httpforward_obj_from_dynamic(dynamic_http_forward_entry)
+                dynamic_http_forward = self._build_httpforward_obj_from_dynamic(dynamic_http_forward_entry, self.t)
                 if dynamic_http_forward:
                     valid_domains.add(dynamic_http_forward.fqdn.lower())
 
+            valid_tcp_ports.update(f.source_port for f in self.t.get_tcp_forwards())
+            valid_udp_ports.update(f.source_port for f in self.t.get_udp_forwards())
+
         for static_http_forward_entry in static_http_forwards:
             static_http_forward = self._build_httpforward_obj_from_static(static_http_forward_entry)
             if static_http_forward:
@@ -209,3 +350,11 @@ class Sync:
 
         return valid_domains, valid_tcp_ports, valid_udp_ports
 
+    def get_valid_resource_keys(self, static_http_forwards: list, static_tcp_forwards: list, static_udp_forwards: list) -> set:
+        """Resource keys (see Pangolin.get_resource_key) of all valid resources from Traefik and static config"""
+        valid_domains, valid_tcp_ports, valid_udp_ports = self.get_valid_resources(
+            static_http_forwards, static_tcp_forwards, static_udp_forwards
+        )
+        return ({f"http:{domain}" for domain in valid_domains} |
+                {f"tcp:{port}" for port in valid_tcp_ports} |
+                {f"udp:{port}" for port in valid_udp_ports})
@@ -1,6 +1,11 @@
+import logging
 import requests
+from typing import Any, Optional
+import json_codec
 from settings import Settings
-from models import TraefikSite
+from models import TraefikSite, TraefikDiscoveryMode, TCPForward, UDPForward
+
+log = logging.getLogger(__name__)
 
 
 class Traefik:
@@ -8,40 +13,197 @@ class Traefik:
         self.s = s
         self.traefik_site = traefik_site
         self.hosts = []
+        self.rejected_hosts = []
+        self.tcp_forwards = []
+        self.udp_forwards = []
+        # Entrypoint ports from the last fetch, kept with the site's discovery in the sync state
+        self.entrypoint_ports = {}
+        self.fetched = False
+        self.fetch_failed = False
+        self.stale = False
+        # Reuses the connection for the requests of one discovery (rawdata and entrypoints)
+        self.session = requests.Session()
+
+    @property
+    def name(self):
+        return self.traefik_site.name
 
     @property
     def site_name(self):
         return self.traefik_site.site_name
 
-    def _get_traefik_hosts_raw(self) -> list:
-        response = requests.get(self.traefik_site.api_url + self.traefik_site.api_http_routers_path)
+    def _get_json(self, path: str) -> Optional[Any]:
+        url = self.traefik_site.api_url + path
+        timeout = (self.traefik_site.connect_timeout, self.traefik_site.read_timeout)
+        try:
+            response = self.session.get(url, timeout=timeout)
+        except requests.exceptions.Timeout:
+            log.error("Error fetching Traefik data: request to %s timed out", url)
+            return None
+        except requests.exceptions.RequestException as e:
+            log.error("Error fetching Traefik data: %s", e)
+            return None
+
         if response.status_code != 200:
-            print(f"Error fetching Traefik hosts: {response.status_code} - {response.text}")
-            return []
+            log.error("Error fetching Traefik data: %s - %s", response.status_code, response.text)
+            return None
 
         try:
-            hosts_raw = response.json()
+            return json_codec.loads(response.content)
         except ValueError as e:
-            print(f"Error parsing JSON response from Traefik: {e}")
-            return []
+            log.error("Error parsing JSON response from Traefik: %s", e)
+            return None
+
+    def _get_traefik_hosts_raw(self) -> Optional[list]:
+        hosts_raw = self._get_json(self.traefik_site.api_http_routers_path)
+        if hosts_raw is None:
+            return None
 
         if not isinstance(hosts_raw, list):
-            print("Unexpected format for Traefik hosts data. Expected a list.")
-            return []
+            log.error("Unexpected format for Traefik hosts data. Expected a list.")
+            return None
 
         return hosts_raw
 
+    def _get_traefik_rawdata(self) -> Optional[dict]:
+        rawdata = self._get_json(self.traefik_site.api_rawdata_path)
+        if rawdata is None:
+            return None
+
+        if not isinstance(rawdata, dict):
+            log.error("Unexpected format for Traefik rawdata. Expected an object.")
+            return None
+
+        return rawdata
+
+    def _get_entrypoint_ports(self, entrypoints: set) -> Optional[dict]:
+        """Map entrypoint names to ports, from settings, the last fetch or Traefik's entrypoints API.
+        Entrypoints only change when Traefik restarts, so the API is only asked again for unknown ones."""
+        if self.traefik_site.entrypoint_ports:
+            return self.traefik_site.entrypoint_ports
+
+        if entrypoints <= set(self.entrypoint_ports):
+            return self.entrypoint_ports
+
+        entrypoints_raw = self._get_json(self.traefik_site.api_entrypoints_path)
+        if entrypoints_raw is None:
+            return None
+
+        if not isinstance(entrypoints_raw, list):
+            log.error("Unexpected format for Traefik entrypoints data. Expected a list.")
+            return None
+
+        # Addresses look like ":2222", "0.0.0.0:53/udp" or "[::]:443"
+        entrypoint_ports = {}
+        for entrypoint in entrypoints_raw:
+            port = entrypoint.get('address', '').rsplit(':', 1)[-1].split('/')[0]
+            if port.isdigit():
+                entrypoint_ports[entrypoint['name']] = int(port)
+        self.entrypoint_ports = entrypoint_ports
+        return entrypoint_ports
+
     def _clean_traefik_hosts_raw(self, hosts_raw: list) -> list:
         filtered = [h['rule'] for h in hosts_raw if any(domain in h['rule'] for domain in self.traefik_site.host_whitelist)]
         trimmed = [t.split('`')[1] for t in filtered]
         return trimmed
 
+    def _get_rejected_hosts(self, hosts_raw: list) -> list:
+        """Hosts of routers that don't match the whitelist"""
+        rejected = [h['rule'] for h in hosts_raw if '`' in h['rule'] and not any(domain in h['rule'] for domain in self.traefik_site.host_whitelist)]
+        return self._remove_duplicate_hosts([r.split('`')[1] for r in rejected])
+
     def _remove_duplicate_hosts(self, hosts: list) -> list:
         return list(set(hosts))
 
+    def _served_routers(self, routers: list) -> list:
+        """Drop disabled routers, routers with warnings are still served by Traefik"""
+        return [r for r in routers if r.get('status') != 'disabled']
+
+    def _get_router_ports(self, routers: list, entrypoint_ports: dict) -> dict:
+        """Map each whitelisted entrypoint port used by the routers to its entrypoint name"""
+        ports = {}
+        for router in routers:
+            for entrypoint in router.get('entryPoints', []):
+                if entrypoint not in self.traefik_site.entrypoint_whitelist:
+                    continue
+
+                port = entrypoint_ports.get(entrypoint)
+                if not port:
+                    log.warning("No port known for Traefik entrypoint %s, skipping", entrypoint)
+                    continue
+                ports[port] = entrypoint
+        return ports
+
+    def _build_l4_forwards(self, forward_type: type, ports: dict) -> list:
+        return [forward_type(name=entrypoint,
+                             site_name=self.site_name,
+                             source_port=port,
+                             target_host=self.traefik_site.target_host,
+                             target_port=port)
+                for port, entrypoint in sorted(ports.items())]
+
+    def _discover_from_routers(self) -> bool:
+        hosts_raw = self._get_traefik_hosts_raw()
+        if hosts_raw is None:
+            return False
+
+        hosts_raw = self._served_routers(hosts_raw)
+        hosts_cleaned = self._clean_traefik_hosts_raw(hosts_raw)
+        self.hosts = self._remove_duplicate_hosts(hosts_cleaned)
+        self.rejected_hosts = self._get_rejected_hosts(hosts_raw)
+        return True
+
+    def _discover_from_rawdata(self) -> bool:
+        rawdata = self._get_traefik_rawdata()
+        if rawdata is None:
+            return False
+
+        http_routers = [r for r in self._served_routers(list((rawdata.get('routers') or {}).values())) if 'rule' in r]
+        self.hosts = self._remove_duplicate_hosts(self._clean_traefik_hosts_raw(http_routers))
+        self.rejected_hosts = self._get_rejected_hosts(http_routers)
+
+        tcp_routers = self._served_routers(list((rawdata.get('tcpRouters') or {}).values()))
+        udp_routers = self._served_routers(list((rawdata.get('udpRouters') or {}).values()))
+        if not self.traefik_site.entrypoint_whitelist or not (tcp_routers or udp_routers):
+            return True
+
+        entrypoints = {entrypoint for router in tcp_routers + udp_routers for entrypoint in router.get('entryPoints', [])
+                       if entrypoint in self.traefik_site.entrypoint_whitelist}
+        entrypoint_ports = self._get_entrypoint_ports(entrypoints)
+        if entrypoint_ports is None:
+            return False
+
+        self.tcp_forwards = self._build_l4_forwards(TCPForward, self._get_router_ports(tcp_routers, entrypoint_ports))
+        self.udp_forwards = self._build_l4_forwards(UDPForward, self._get_router_ports(udp_routers, entrypoint_ports))
+        return True
+
+    def _discover(self) -> None:
+        if self.fetched:
+            return
+
+        self.fetched = True
+        if self.traefik_site.discovery_mode == TraefikDiscoveryMode.RAWDATA:
+            success = self._discover_from_rawdata()
+        else:
+            success = self._discover_from_routers()
+        self.fetch_failed = not success
+
+    def use_stale_discovery(self, hosts: list, tcp_forwards: list, udp_forwards: list) -> None:
+        """Serve previously discovered hosts and forwards instead of querying Traefik"""
+        self.hosts = list(hosts)
+        self.tcp_forwards = list(tcp_forwards)
+        self.udp_forwards = list(udp_forwards)
+        self.fetched = True
+        self.stale = True
+
     def get_hosts(self) -> list:
-        if not self.hosts:
-            hosts_raw = self._get_traefik_hosts_raw()
-            hosts_cleaned = self._clean_traefik_hosts_raw(hosts_raw)
-            self.hosts = self._remove_duplicate_hosts(hosts_cleaned)
+        self._discover()
         return self.hosts
+
+    def get_tcp_forwards(self) -> list[TCPForward]:
+        self._discover()
+        return self.tcp_forwards
+
+    def get_udp_forwards(self) -> list[UDPForward]:
+        self._discover()
+        return self.udp_forwards